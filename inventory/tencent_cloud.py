@@ -38,9 +38,16 @@ import os
 import argparse
 import re
 import configparser
+import dbm
+import pickle
+import threading
 
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from time import time
 from tencentcloud.common import credential
+from tencentcloud.common.profile.client_profile import ClientProfile
+from tencentcloud.common.profile.http_profile import HttpProfile
 from tencentcloud.cvm.v20170312 import cvm_client, models
 
 try:
@@ -48,9 +55,35 @@ try:
 except ImportError:
     import simplejson as json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class CvmInventory(object):
 
+    # Mapping of every 'bad' ASCII character to an underscore, built once at
+    # class scope; str.translate through it is several times faster than the
+    # regex, which stays as the fallback for non-ASCII input.
+    _SAFE_TABLE = str.maketrans(
+        {c: '_' for c in map(chr, range(128)) if not (c.isalnum() or c == '_')})
+    _SAFE_PATTERN = re.compile(r"[^A-Za-z0-9\_]")
+
+    # Global inline flag groups like (?i); scoped forms like (?i:...) are
+    # harmless and deliberately not matched.
+    _GLOBAL_FLAGS = re.compile(r"\(\?[aiLmsux]+\)")
+
+    # Instance attributes exposed as host variables, keyed by SDK field name.
+    _FIELD_MAP = {
+        "InstanceId": "id",
+        "InstanceName": "instance_name",
+        "InstanceType": "instance_type",
+        "PublicIpAddresses": "public_ip_address",
+        "PrivateIpAddresses": "private_ip_address",
+        "InstanceState": "status",
+    }
+
     def _empty_inventory(self):
         return {"_meta": {"hostvars": {}}}
 
@@ -62,13 +95,33 @@ class CvmInventory(object):
         # Index of hostname (address) to instance ID
         self.index = {}
 
+        # Group membership, collected in O(1) structures and collapsed into
+        # the legacy inventory dict shape once all instances are merged
+        self._group_hosts = defaultdict(list)
+        self._group_children = defaultdict(set)
+
         # TencentCloud credentials.
         self.credentials = {}
+        self._credential = None
+
+        # Clients to api server, one per region, sharing a keep-alive
+        # profile so paginated calls reuse the TLS session instead of
+        # re-handshaking per page
+        http_profile = HttpProfile(keepAlive=True, reqTimeout=30)
+        self._client_profile = ClientProfile(
+            httpProfile=http_profile, signMethod="TC3-HMAC-SHA256")
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+        # Instances fetched for --host lookups, keyed by instance ID
+        self._instances_by_id = {}
 
         # Init variables
+        self._refreshed = False
         self.regions = []
         self.cache_path_cache = ""
         self.cache_path_index = ""
+        self.cache_path_index_db = ""
         self.cache_max_age = 0
 
         # Read settings and parse CLI arguments
@@ -86,7 +139,7 @@ class CvmInventory(object):
         if self.args.host:
             data_to_print = self.get_host_info()
         elif self.args.list:
-            if self.inventory == self._empty_inventory():
+            if not self._refreshed:
                 data_to_print = self.get_inventory_from_cache()
             else:
                 data_to_print = self.json_format_dict(self.inventory, True)
@@ -116,6 +169,10 @@ class CvmInventory(object):
             os.environ.get("TENCENTCLOUD_INI_PATH", default_config_path)))
         config.read(config_path)
 
+        # Snapshot the cvm section into a plain dict once; ConfigParser
+        # re-does case folding and DEFAULT-section lookups on every get.
+        cvm_opts = dict(config.items('cvm')) if config.has_section('cvm') else {}
+
         # Credential
         secret_id = os.environ.get('TENCENTCLOUD_SECRET_ID', None)
         if not secret_id:
@@ -132,46 +189,42 @@ class CvmInventory(object):
         self.credentials['tencentcloud_secret_id'] = secret_id
         self.credentials['tencentcloud_secret_key'] = secret_key
         self.credentials['tencentcloud_security_token'] = token
+        self._credential = credential.Credential(secret_id, secret_key, token)
 
         # Regions
-        config_regions = self.get_option(config, 'cvm', 'regions')
-        exclude_regions = self.get_option(config, 'cvm', 'regions_exclude')
+        config_regions = cvm_opts.get('regions')
+        exclude_regions = cvm_opts.get('regions_exclude')
         if not config_regions or config_regions == 'all':
             all_regions = self.describe_regions()
-
-            if exclude_regions:
-                for region in all_regions:
-                    if region in exclude_regions:
-                        continue
-            else:
-                self.regions = all_regions
+            excluded = set((exclude_regions or '').split(','))
+            self.regions = [
+                region for region in all_regions if region not in excluded]
         else:
             self.regions = config_regions.split(",")
 
         # Cache
-        cache_dir = os.path.expanduser(
-            self.get_option(config, 'cvm', 'cache_path'))
+        cache_dir = os.path.expanduser(cvm_opts.get('cache_path'))
         if not os.path.exists(cache_dir):
             os.makedirs(cache_dir)
         cache_name = 'ansible-tencentcloud'
-        self.cache_path_cache = cache_dir + "/%s.cache" % cache_name
-        self.cache_path_index = cache_dir + "/%s.index" % cache_name
-        self.cache_max_age = float(
-            self.get_option(config, 'cvm', 'cache_max_age'))
+        self.cache_path_cache = os.path.join(cache_dir, "%s.cache" % cache_name)
+        self.cache_path_index = os.path.join(cache_dir, "%s.index" % cache_name)
+        self.cache_path_index_db = os.path.join(
+            cache_dir, "%s.index.db" % cache_name)
+        self.cache_max_age = float(cvm_opts.get('cache_max_age'))
 
         # Destination
-        self.destination_variable = self.get_option(
-            config, 'cvm', 'destination_variable')
+        self.destination_variable = cvm_opts.get('destination_variable')
 
         # Instance states
         cvm_valid_instance_states = [
             'PENDING', 'RUNNING', 'STOPPED', 'STARTING', 'STOPPING', 'REBOOTING']
 
         self.cvm_instance_states = []
-        if self.get_option(config, 'cvm', 'all_instances'):
+        if cvm_opts.get('all_instances'):
             self.cvm_instance_states.extend(cvm_valid_instance_states)
-        elif self.get_option(config, 'cvm', 'instance_states'):
-            for instance_state in self.get_option(config, 'cvm', 'instance_states').split(','):
+        elif cvm_opts.get('instance_states'):
+            for instance_state in cvm_opts.get('instance_states').split(','):
                 instance_state = instance_state.strip().upper()
                 if instance_state not in cvm_valid_instance_states:
                     continue
@@ -180,7 +233,12 @@ class CvmInventory(object):
             self.cvm_instance_states.append('RUNNING')
 
         # Configure nested groups instead of flat namespace.
-        self.nested_groups = self.get_option(config, 'cvm', 'nested_groups')
+        self.nested_groups = cvm_opts.get('nested_groups')
+
+        # Whether to embed full host variables in _meta.hostvars. When off,
+        # Ansible falls back to calling --host for each host it needs.
+        self.populate_hostvars = cvm_opts.get(
+            'populate_hostvars', 'True').lower() not in ('false', 'no', '0')
 
         # Configure which groups should be created.
         group_by_options = [
@@ -196,28 +254,187 @@ class CvmInventory(object):
             'group_by_tag_none'
         ]
         for option in group_by_options:
-            setattr(self, option, self.get_option(config, 'cvm', option))
+            setattr(self, option, cvm_opts.get(option))
 
         # Do we need to just include hosts that match a pattern?
-        try:
-            pattern_include = self.get_option(config, 'cvm', 'pattern_include')
-            if pattern_include and len(pattern_include) > 0:
-                self.pattern_include = re.compile(pattern_include)
-            else:
-                self.pattern_include = None
-        except configparser.NoOptionError:
+        pattern_include = cvm_opts.get('pattern_include')
+        if pattern_include and len(pattern_include) > 0:
+            self.pattern_include = re.compile(pattern_include)
+        else:
             self.pattern_include = None
 
         # Do we need to exclude hosts that match a pattern?
-        try:
-            pattern_exclude = self.get_option(config, 'cvm', 'pattern_exclude')
-            if pattern_exclude and len(pattern_exclude) > 0:
-                self.pattern_exclude = re.compile(pattern_exclude)
-            else:
-                self.pattern_exclude = None
-        except configparser.NoOptionError:
+        pattern_exclude = cvm_opts.get('pattern_exclude')
+        if pattern_exclude and len(pattern_exclude) > 0:
+            self.pattern_exclude = re.compile(pattern_exclude)
+        else:
             self.pattern_exclude = None
 
+        # Fuse the include/exclude patterns into a single compiled match so
+        # the hot path enters the regex engine at most once per instance.
+        # Fusing is only done when both patterns are provably safe to embed
+        # in a larger expression; otherwise a closure evaluates the two
+        # already-compiled patterns, still via a single hot-path call.
+        if pattern_include and pattern_exclude:
+            include_match = self.pattern_include.match
+            exclude_match = self.pattern_exclude.match
+            self._pattern_match = (
+                lambda dest: include_match(dest) and not exclude_match(dest))
+            if self._can_fuse_pattern(self.pattern_include, pattern_include) and \
+                    self._can_fuse_pattern(self.pattern_exclude, pattern_exclude):
+                try:
+                    self._pattern_match = re.compile(
+                        "(?=^(?:%s))(?!^(?:%s))" % (pattern_include, pattern_exclude)).match
+                except re.error:
+                    pass
+        elif pattern_include:
+            self._pattern_match = self.pattern_include.match
+        elif pattern_exclude:
+            exclude_match = self.pattern_exclude.match
+            self._pattern_match = lambda dest: not exclude_match(dest)
+            if self._can_fuse_pattern(self.pattern_exclude, pattern_exclude):
+                try:
+                    self._pattern_match = re.compile(
+                        "(?!^(?:%s))" % pattern_exclude).match
+                except re.error:
+                    pass
+        else:
+            self._pattern_match = None
+
+        # Resolve config-time decisions into specialized callables, so
+        # add_instance does not re-test the same options once per instance.
+        self._get_dest = self._make_dest_getter()
+        self._groupers = self._build_groupers()
+
+    def _can_fuse_pattern(self, compiled, pattern):
+        ''' Whether a pattern keeps its meaning when embedded in a larger
+        expression: capturing groups would renumber backreferences across the
+        fused pattern, and a global inline flag would leak onto the other
+        pattern (silently so on Python <= 3.10) '''
+
+        return compiled.groups == 0 and not self._GLOBAL_FLAGS.search(pattern)
+
+    def _make_dest_getter(self):
+        ''' Resolves destination_variable into a per-instance address getter '''
+
+        # Read the address list attribute once per instance; attribute access
+        # on the SDK models is not free.
+        if self.destination_variable == 'public_ip_address':
+            def get_dest(instance):
+                ips = instance.PublicIpAddresses
+                return ips[0] if ips else None
+            return get_dest
+        if self.destination_variable == 'private_ip_address':
+            def get_dest(instance):
+                ips = instance.PrivateIpAddresses
+                return ips[0] if ips else None
+            return get_dest
+        return lambda instance: None
+
+    def _build_groupers(self):
+        ''' Builds the list of grouping rules enabled in the config, so only
+        the group_by_* options actually turned on cost anything per instance '''
+
+        push = self.push
+        push_group = self.push_group
+        to_safe = self.to_safe
+        nested = self.nested_groups
+        groupers = []
+
+        if self.group_by_instance_id:
+            def group_instance_id(instance, dest, region):
+                key = to_safe(instance.InstanceId)
+                push(key, dest)
+                if nested:
+                    push_group('instances', key)
+            groupers.append(group_instance_id)
+
+        if self.group_by_region:
+            def group_region(instance, dest, region):
+                key = to_safe(region)
+                push(key, dest)
+                if nested:
+                    push_group('regions', key)
+            groupers.append(group_region)
+
+        if self.group_by_availability_zone:
+            def group_availability_zone(instance, dest, region):
+                key = to_safe(instance.Placement.Zone)
+                push(key, dest)
+                if nested:
+                    if self.group_by_region:
+                        push_group(to_safe(region), key)
+                    push_group('zones', key)
+            groupers.append(group_availability_zone)
+
+        if self.group_by_image_id:
+            def group_image_id(instance, dest, region):
+                key = to_safe(instance.ImageId)
+                push(key, dest)
+                if nested:
+                    push_group('images', key)
+            groupers.append(group_image_id)
+
+        if self.group_by_instance_type:
+            def group_instance_type(instance, dest, region):
+                key = to_safe('type_' + instance.InstanceType)
+                push(key, dest)
+                if nested:
+                    push_group('types', key)
+            groupers.append(group_instance_type)
+
+        if self.group_by_vpc_id:
+            def group_vpc_id(instance, dest, region):
+                key = to_safe('vpc_' + instance.VirtualPrivateCloud.VpcId)
+                push(key, dest)
+                if nested:
+                    push_group('vpcs', key)
+            groupers.append(group_vpc_id)
+
+        if self.group_by_subnet_id:
+            def group_subnet_id(instance, dest, region):
+                key = to_safe(
+                    'subnet_' + instance.VirtualPrivateCloud.SubnetId)
+                push(key, dest)
+                if nested:
+                    push_group('subnets', key)
+            groupers.append(group_subnet_id)
+
+        if self.group_by_security_group:
+            def group_security_group(instance, dest, region):
+                for group in instance.SecurityGroupIds or ():
+                    key = to_safe('security_group_' + group)
+                    push(key, dest)
+                    if nested:
+                        push_group('security_groups', key)
+            groupers.append(group_security_group)
+
+        if self.group_by_tag_keys:
+            def group_tag_keys(instance, dest, region):
+                for tag in instance.Tags or ():
+                    tag_value = tag.Value
+                    # to_safe is idempotent, so the base key can be reused
+                    # for the value variant and both nested pushes
+                    base = to_safe('tag_' + tag.Key)
+                    if tag_value:
+                        key = to_safe(base + '=' + tag_value)
+                    else:
+                        key = base
+                    push(key, dest)
+                    if nested:
+                        push_group('tags', base)
+                        push_group(base, key)
+            groupers.append(group_tag_keys)
+
+        if self.group_by_tag_none:
+            def group_tag_none(instance, dest, region):
+                push('tag_none', dest)
+                if nested:
+                    push_group('tags', 'tag_none')
+            groupers.append(group_tag_none)
+
+        return groupers
+
     def get_option(self, config, module, name, default=None):
         ''' Get module argument from config '''
 
@@ -229,13 +446,15 @@ class CvmInventory(object):
         return option
 
     def get_cvm_client(self, region):
-        ''' create client to api server'''
+        ''' create client to api server, reusing one client per region'''
 
-        cred = credential.Credential(self.credentials['tencentcloud_secret_id'],
-                                     self.credentials['tencentcloud_secret_key'],
-                                     self.credentials['tencentcloud_security_token'])
-        client = cvm_client.CvmClient(cred, region)
-        return client
+        with self._clients_lock:
+            client = self._clients.get(region)
+            if client is None:
+                client = cvm_client.CvmClient(
+                    self._credential, region, self._client_profile)
+                self._clients[region] = client
+            return client
 
     def describe_regions(self):
 
@@ -248,35 +467,58 @@ class CvmInventory(object):
         return regions
 
     def do_api_calls_update_cache(self):
-        ''' Do API calls to each region, and save data in cache files '''
-
-        for region in self.regions:
-            self.get_instances_by_region(region)
-
+        ''' Do API calls to each region in parallel, and save data in cache files '''
+
+        if self.regions:
+            with ThreadPoolExecutor(max_workers=min(len(self.regions), 16)) as executor:
+                futures = [executor.submit(self.get_instances_by_region, region)
+                           for region in self.regions]
+                for future in futures:
+                    region, instances = future.result()
+                    for instance in instances:
+                        self.add_instance(instance, region)
+
+        self.materialize_groups()
+        if not self.populate_hostvars:
+            # Even an empty _meta.hostvars tells Ansible to never call
+            # --host, so drop the key entirely when hostvars are disabled
+            self.inventory.pop('_meta', None)
         self.write_to_cache(self.inventory, self.cache_path_cache)
-        self.write_to_cache(self.index, self.cache_path_index)
+        self.write_index_to_cache()
+        self._refreshed = True
 
     def get_instances_by_region(self, region):
-        ''' Makes an API call to the list of instances in a particular region '''
+        ''' Makes an API call to the list of instances in a particular region.
+        Returns the region and its instances so the caller can merge them into
+        the inventory from a single thread. '''
 
-        client = self.get_cvm_client(region)
-        instances = []
-        page_number = 0
-        limit = 20
-        while True:
-            request = models.DescribeInstancesRequest()
-            request.Offset = limit * page_number
-            request.Limit = limit
-            response = client.DescribeInstances(request)
-            # print(request.to_json_string())
-            # print(response.to_json_string())
-            instances.extend(response.InstanceSet)
-            if len(response.InstanceSet) < limit:
-                break
-            page_number += 1
+        limit = 100
+        response = self.describe_instances_page(region, 0, limit)
+        instances = list(response.InstanceSet)
+
+        # TotalCount from the first page tells us every remaining offset, so
+        # the rest of the pages can be fetched concurrently.
+        offsets = range(limit, response.TotalCount, limit)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=min(len(offsets), 16)) as executor:
+                futures = [executor.submit(self.describe_instances_page, region, offset, limit)
+                           for offset in offsets]
+                for future in futures:
+                    instances.extend(future.result().InstanceSet)
+
+        return region, instances
 
-        for instance in instances:
-            self.add_instance(instance, region)
+    def describe_instances_page(self, region, offset, limit):
+        ''' Makes a single DescribeInstances API call for one page of a region '''
+
+        client = self.get_cvm_client(region)
+        request = models.DescribeInstancesRequest()
+        request.Offset = offset
+        request.Limit = limit
+        response = client.DescribeInstances(request)
+        # print(request.to_json_string())
+        # print(response.to_json_string())
+        return response
 
     def add_instance(self, instance, region):
         ''' Adds an instance to the inventory and index, as long as it is
@@ -287,134 +529,108 @@ class CvmInventory(object):
             return
 
         # Select the best destination address
-        if self.destination_variable:
-            dest = None
-            if self.destination_variable == 'public_ip_address' and instance.PublicIpAddresses and len(instance.PublicIpAddresses) > 0:
-                dest = instance.PublicIpAddresses[0]
-            elif self.destination_variable == 'private_ip_address' and instance.PrivateIpAddresses and len(instance.PrivateIpAddresses) > 0:
-                dest = instance.PrivateIpAddresses[0]
-
+        dest = self._get_dest(instance)
         if not dest:
             return
 
-        # if we only want to include hosts that match a pattern, skip those that don't
-        if self.pattern_include and not self.pattern_include.match(dest):
+        # skip hosts that fail the fused include/exclude pattern
+        if self._pattern_match and not self._pattern_match(dest):
             return
 
-        # if we need to exclude hosts that match a pattern, skip those
-        if self.pattern_exclude and self.pattern_exclude.match(dest):
-            return
-
-        self.index[dest] = [region, instance.InstanceId]
-
-        if self.group_by_instance_id:
-            key = self.to_safe(instance.InstanceId)
-            self.push(self.inventory, key, dest)
-            if self.nested_groups:
-                self.push_group(self.inventory, 'instances',
-                                key)
+        instance_id = instance.InstanceId
+        self.index[dest] = [region, instance_id]
+        # the instance is already in hand, so a later --host lookup in this
+        # process must not re-download it
+        self._instances_by_id[instance_id] = instance
 
-        if self.group_by_region:
-            key = self.to_safe(region)
-            self.push(self.inventory, key, dest)
-            if self.nested_groups:
-                self.push_group(self.inventory, 'regions', key)
+        for grouper in self._groupers:
+            grouper(instance, dest, region)
 
-        if self.group_by_availability_zone:
-            key = self.to_safe(instance.Placement.Zone)
-            self.push(self.inventory, key, dest)
-            if self.nested_groups:
-                if self.group_by_region:
-                    self.push_group(self.inventory, self.to_safe(region), key)
-                self.push_group(self.inventory, 'zones', key)
+        self.push('tencentcloud', dest)
 
-        if self.group_by_image_id:
-            key = self.to_safe(instance.ImageId)
-            self.push(self.inventory, key, dest)
-            if self.nested_groups:
-                self.push_group(self.inventory, 'images', key)
+        if self.populate_hostvars:
+            self.inventory['_meta']['hostvars'][dest] = self.get_host_info_dict_from_instance(
+                instance)
+            self.inventory['_meta']['hostvars'][dest]['ansible_ssh_host'] = dest
 
-        if self.group_by_instance_type:
-            key = self.to_safe('type_' + instance.InstanceType)
-            self.push(self.inventory, key, dest)
-            if self.nested_groups:
-                self.push_group(self.inventory, 'types', key)
+    def push(self, key, element):
+        ''' Push an element onto a group's host list '''
 
-        if self.group_by_vpc_id:
-            key = self.to_safe('vpc_' + instance.VirtualPrivateCloud.VpcId)
-            self.push(self.inventory, key, dest)
-            if self.nested_groups:
-                self.push_group(self.inventory, 'vpcs', key)
+        self._group_hosts[key].append(element)
 
-        if self.group_by_subnet_id:
-            key = self.to_safe(
-                'subnet_' + instance.VirtualPrivateCloud.SubnetId)
-            self.push(self.inventory, key, dest)
-            if self.nested_groups:
-                self.push_group(self.inventory, 'subnets', key)
-
-        if self.group_by_security_group:
-            for group in instance.SecurityGroupIds:
-                key = self.to_safe('security_group_' + group)
-                self.push(self.inventory, key, dest)
-                if self.nested_groups:
-                    self.push_group(self.inventory, 'security_groups', key)
-
-        if self.group_by_tag_keys:
-            for tag in instance.Tags:
-                if tag.Value:
-                    key = self.to_safe('tag_' + tag.Key + '=' + tag.Value)
-                else:
-                    key = self.to_safe('tag_' + tag.Key)
-                self.push(self.inventory, key, dest)
-                if self.nested_groups:
-                    self.push_group(self.inventory, 'tags',
-                                    self.to_safe('tag_' + tag.Key))
-                    self.push_group(self.inventory, self.to_safe(
-                        'tag_' + tag.Key), key)
+    def push_group(self, key, element):
+        ''' Push a group as a child of another group. '''
 
-        if self.group_by_tag_none:
-            self.push(self.inventory, 'tag_none', dest)
-            if self.nested_groups:
-                self.push_group(self.inventory, 'tags', 'tag_none')
+        self._group_children[key].add(element)
 
-        self.push(self.inventory, 'tencentcloud', dest)
+    def materialize_groups(self):
+        ''' Collapses the group structures into the legacy inventory shape:
+        a plain host list per group, or a dict with hosts/children keys for
+        groups that have child groups '''
 
-        self.inventory['_meta']['hostvars'][dest] = self.get_host_info_dict_from_instance(
-            instance)
-        self.inventory['_meta']['hostvars'][dest]['ansible_ssh_host'] = dest
+        for key, children in self._group_children.items():
+            group = {'children': sorted(children)}
+            hosts = self._group_hosts.get(key)
+            if hosts:
+                group['hosts'] = hosts
+            self.inventory[key] = group
+        for key, hosts in self._group_hosts.items():
+            if key not in self._group_children:
+                self.inventory[key] = hosts
 
-    def push(self, my_dict, key, element):
-        ''' Push an element onto an array that may not have been defined in the dict '''
+    def write_to_cache(self, data, filename):
+        ''' Writes data in compact JSON format to a file, replacing it atomically '''
 
-        group_info = my_dict.setdefault(key, [])
-        if isinstance(group_info, dict):
-            host_list = group_info.setdefault('hosts', [])
-            host_list.append(element)
+        # The cache is only read back by this script, so the pretty-printed
+        # form is pure overhead; writing through a temp file means a crash
+        # can never leave a half-written cache behind.
+        if orjson is not None:
+            json_data = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
         else:
-            group_info.append(element)
-
-    def push_group(self, my_dict, key, element):
-        ''' Push a group as a child of another group. '''
-
-        parent_group = my_dict.setdefault(key, {})
-        if not isinstance(parent_group, dict):
-            parent_group = my_dict[key] = {'hosts': parent_group}
-        child_groups = parent_group.setdefault('children', [])
-        if element not in child_groups:
-            child_groups.append(element)
+            json_data = self.json_format_dict(data).encode()
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'wb') as cache:
+            cache.write(json_data)
+        os.replace(tmp_filename, filename)
+
+    def write_index_to_cache(self):
+        ''' Writes the index to its cache files: a pickle of the full dict
+        plus a dbm sidecar for per-host lookups '''
+
+        # The index is only ever read back by load_index_from_cache, and
+        # pickle deserializes string-heavy dicts several times faster than
+        # JSON -- this runs on every single --host invocation.
+        tmp_filename = self.cache_path_index + '.tmp'
+        with open(tmp_filename, 'wb') as cache:
+            pickle.dump(self.index, cache, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, self.cache_path_index)
+
+        # Ansible invokes --host once per host; the dbm sidecar lets each of
+        # those invocations read one record instead of the whole index.
+        with dbm.open(self.cache_path_index_db, 'n') as db:
+            for dest, (region, instance_id) in self.index.items():
+                db[dest] = '%s\0%s' % (region, instance_id)
+
+    def load_index_entry_from_cache(self, host):
+        ''' Looks up a single host in the dbm index sidecar, returning
+        [region, instance_id] or None without deserializing the whole index '''
 
-    def write_to_cache(self, data, filename):
-        ''' Writes data in JSON format to a file '''
-
-        json_data = self.json_format_dict(data, True)
-        cache = open(filename, 'w')
-        cache.write(json_data)
-        cache.close()
+        try:
+            with dbm.open(self.cache_path_index_db, 'r') as db:
+                entry = db[host]
+        # dbm.error is itself a tuple of exception types, so extend it
+        # rather than nesting it inside another tuple
+        except dbm.error + (OSError, KeyError):
+            return None
+        region, instance_id = entry.decode().split('\0', 1)
+        return [region, instance_id]
 
     def json_format_dict(self, data, pretty=False):
         ''' Converts a dict to a JSON object and dumps it as a formatted string '''
 
+        if orjson is not None:
+            option = orjson.OPT_SORT_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+            return orjson.dumps(data, option=option).decode()
         if pretty:
             return json.dumps(data, sort_keys=True, indent=2)
         else:
@@ -424,23 +640,43 @@ class CvmInventory(object):
         ''' Determines if the cache files have expired, or if it is still valid '''
 
         if os.path.isfile(self.cache_path_cache) and os.path.isfile(self.cache_path_index):
-            update_time = os.path.getmtime(self.cache_path_cache)
-            if (update_time + self.cache_max_age) > time():
+            # Both files must be fresh; otherwise get_host_info could read a
+            # stale index against a fresh inventory.
+            update_time = min(os.path.getmtime(self.cache_path_cache),
+                              os.path.getmtime(self.cache_path_index))
+            now = time()
+            if (update_time + self.cache_max_age) > now:
                 return True
         return False
 
+    def _read_cache_file(self, filename):
+        ''' Reads a cache file in one call, skipping the atime update where
+        the platform supports O_NOATIME '''
+
+        try:
+            fd = os.open(filename, os.O_RDONLY | getattr(os, 'O_NOATIME', 0))
+        except PermissionError:
+            # O_NOATIME is only allowed for the file owner
+            fd = os.open(filename, os.O_RDONLY)
+        with os.fdopen(fd, 'rb') as cache:
+            return cache.read()
+
     def get_inventory_from_cache(self):
         ''' Reads the inventory from the cache file and returns it as a JSON object '''
 
-        cache = open(self.cache_path_cache, 'r')
-        json_inventory = cache.read()
-        return json_inventory
+        return self._read_cache_file(self.cache_path_cache).decode()
 
     def get_host_info(self):
         ''' Get variables about a specific host '''
 
         if len(self.index) == 0:
-            self.load_index_from_cache()
+            # Try the O(1) sidecar first; fall back to the full index only
+            # when the host is not there.
+            entry = self.load_index_entry_from_cache(self.args.host)
+            if entry is not None:
+                self.index[self.args.host] = entry
+            else:
+                self.load_index_from_cache()
 
         if self.args.host not in self.index:
             self.do_api_calls_update_cache()
@@ -455,52 +691,56 @@ class CvmInventory(object):
     def get_host_info_dict_from_instance(self, instance):
         ''' Get variables from instance that API response '''
 
-        instance_vars = {}
-        for key in vars(instance):
-            if key == "InstanceId":
-                instance_vars["id"] = instance.InstanceId
-            elif key == "InstanceName":
-                instance_vars["instance_name"] = instance.InstanceName
-            elif key == "InstanceType":
-                instance_vars["instance_type"] = instance.InstanceType
-            elif key == "PublicIpAddresses":
-                instance_vars["public_ip_address"] = instance.PublicIpAddresses
-            elif key == "PrivateIpAddresses":
-                instance_vars["private_ip_address"] = instance.PrivateIpAddresses
-            elif key == "Placement":
-                instance_vars["availability_zone"] = instance.Placement.Zone
-            elif key == "InstanceState":
-                instance_vars["status"] = instance.InstanceState
-            else:
-                pass
-
-            # print('key: '+key)
-            # print(value)
+        attrs = vars(instance)
+        instance_vars = {name: attrs[key]
+                         for key, name in self._FIELD_MAP.items() if key in attrs}
+        if "Placement" in attrs:
+            instance_vars["availability_zone"] = attrs["Placement"].Zone
 
         return instance_vars
 
     def get_instance_by_id(self, region, instance_id):
         ''' Get CVM instance in a specified instance id '''
 
+        instance = self._instances_by_id.get(instance_id)
+        if instance is None:
+            self.fetch_instances_by_id(region)
+            instance = self._instances_by_id.get(instance_id)
+        return instance
+
+    def fetch_instances_by_id(self, region):
+        ''' Batch-fetch the indexed instances of a region that are not yet in
+        the in-memory cache, 100 instance ids per DescribeInstances call '''
+
+        instance_ids = [entry[1] for entry in self.index.values()
+                        if entry[0] == region
+                        and entry[1] not in self._instances_by_id]
         client = self.get_cvm_client(region)
-        request = models.DescribeInstancesRequest()
-        request.InstanceIds = [instance_id]
-        response = client.DescribeInstances(request)
-        if len(response.InstanceSet) > 0:
-            return response.InstanceSet[0]
+        for offset in range(0, len(instance_ids), 100):
+            request = models.DescribeInstancesRequest()
+            request.InstanceIds = instance_ids[offset:offset + 100]
+            response = client.DescribeInstances(request)
+            for instance in response.InstanceSet:
+                self._instances_by_id[instance.InstanceId] = instance
 
     def load_index_from_cache(self):
         ''' Reads the index from the cache file sets self.index '''
 
-        cache = open(self.cache_path_index, 'r')
-        json_index = cache.read()
-        self.index = json.loads(json_index)
+        try:
+            self.index = pickle.loads(
+                self._read_cache_file(self.cache_path_index))
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+            # A missing index, or one in the old JSON format left behind by
+            # a previous version, just means the caller has to refresh
+            self.index = {}
 
     def to_safe(self, word):
         ''' Converts 'bad' characters in a string to underscores so they can be
         used as Ansible groups '''
 
-        return re.sub(r"[^A-Za-z0-9\_]", "_", word)
+        if word.isascii():
+            return word.translate(self._SAFE_TABLE)
+        return self._SAFE_PATTERN.sub("_", word)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,266 @@
+# Copyright (c) 2020, TencentCloud
+#
+#  This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible. If not, see http://www.gnu.org/licenses/.
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    name: tencentcloud
+    short_description: TencentCloud CVM inventory source
+    description:
+        - Get inventory hosts from TencentCloud CVM.
+        - Uses a YAML configuration file that ends with C(tencentcloud.yml)
+          or C(tencentcloud.yaml).
+        - Unlike the legacy C(inventory/tencent_cloud.py) script, this plugin
+          runs inside the Ansible process and hands cache management off to
+          Ansible, so the SDK import and API calls are not repeated for every
+          invocation.
+    extends_documentation_fragment:
+        - constructed
+        - inventory_cache
+    options:
+        plugin:
+            description: Token that ensures this is a source file for the plugin.
+            required: true
+            choices: ['tencentcloud']
+        secret_id:
+            description: TencentCloud secret id.
+            type: str
+            env:
+                - name: TENCENTCLOUD_SECRET_ID
+        secret_key:
+            description: TencentCloud secret key.
+            type: str
+            env:
+                - name: TENCENTCLOUD_SECRET_KEY
+        security_token:
+            description: TencentCloud security token, for temporary credentials.
+            type: str
+            env:
+                - name: TENCENTCLOUD_SECURITY_TOKEN
+        regions:
+            description: Regions to make calls to. When empty, all regions are queried.
+            type: list
+            elements: str
+            default: []
+        regions_exclude:
+            description: Regions to skip when I(regions) is empty.
+            type: list
+            elements: str
+            default: []
+        destination_variable:
+            description: Instance address used as the inventory hostname.
+            type: str
+            choices: ['public_ip_address', 'private_ip_address']
+            default: public_ip_address
+        instance_states:
+            description: Only instances in one of these states are returned.
+            type: list
+            elements: str
+            default: ['RUNNING']
+    requirements:
+        - tencentcloud-sdk-python
+'''
+
+EXAMPLES = '''
+# tencentcloud.yml
+plugin: tencentcloud
+regions:
+  - ap-guangzhou
+  - ap-shanghai
+destination_variable: private_ip_address
+keyed_groups:
+  - key: availability_zone
+    prefix: zone
+cache: true
+'''
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ansible.errors import AnsibleError, AnsibleParserError
+from ansible.plugins.inventory import BaseInventoryPlugin, Constructable, Cacheable
+
+try:
+    from tencentcloud.common import credential
+    from tencentcloud.common.profile.client_profile import ClientProfile
+    from tencentcloud.common.profile.http_profile import HttpProfile
+    from tencentcloud.cvm.v20170312 import cvm_client, models
+    HAS_TENCENTCLOUD = True
+except ImportError:
+    HAS_TENCENTCLOUD = False
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'tencentcloud'
+
+    def __init__(self):
+        super(InventoryModule, self).__init__()
+        self._credential = None
+        self._client_profile = None
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def verify_file(self, path):
+        ''' Only accept the documented file names for this plugin '''
+
+        if super(InventoryModule, self).verify_file(path):
+            if path.endswith(('tencentcloud.yml', 'tencentcloud.yaml')):
+                return True
+        return False
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path)
+        if not HAS_TENCENTCLOUD:
+            raise AnsibleError(
+                "The tencentcloud dynamic inventory plugin requires tencentcloud-sdk-python")
+
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option('cache') and cache
+        update_cache = self.get_option('cache') and not cache
+
+        records = None
+        if use_cache:
+            try:
+                records = self._cache[cache_key]
+            except KeyError:
+                update_cache = True
+
+        if records is None:
+            records = self._get_records()
+
+        if update_cache:
+            self._cache[cache_key] = records
+
+        self._populate(records)
+
+    def _get_credential(self):
+        secret_id = self.get_option('secret_id')
+        secret_key = self.get_option('secret_key')
+        if not secret_id or not secret_key:
+            raise AnsibleParserError(
+                "insufficient credentials found: set secret_id/secret_key or "
+                "the TENCENTCLOUD_SECRET_ID/TENCENTCLOUD_SECRET_KEY environment variables")
+        return credential.Credential(
+            secret_id, secret_key, self.get_option('security_token'))
+
+    def _get_client(self, region):
+        # one client per region, shared across the concurrent page fetches,
+        # so keep-alive actually reuses the TLS session
+        with self._clients_lock:
+            client = self._clients.get(region)
+            if client is None:
+                client = cvm_client.CvmClient(
+                    self._credential, region, self._client_profile)
+                self._clients[region] = client
+            return client
+
+    def _get_regions(self):
+        regions = self.get_option('regions')
+        if regions:
+            return regions
+        request = models.DescribeRegionsRequest()
+        response = self._get_client('ap-shanghai').DescribeRegions(request)
+        excluded = set(self.get_option('regions_exclude'))
+        return [item.Region for item in response.RegionSet
+                if item.Region not in excluded]
+
+    def _describe_instances_page(self, region, offset, limit):
+        request = models.DescribeInstancesRequest()
+        request.Offset = offset
+        request.Limit = limit
+        return self._get_client(region).DescribeInstances(request)
+
+    def _get_instances_by_region(self, region):
+        limit = 100
+        response = self._describe_instances_page(region, 0, limit)
+        instances = list(response.InstanceSet)
+
+        offsets = range(limit, response.TotalCount, limit)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=min(len(offsets), 16)) as executor:
+                futures = [executor.submit(self._describe_instances_page, region, offset, limit)
+                           for offset in offsets]
+                for future in futures:
+                    instances.extend(future.result().InstanceSet)
+
+        return region, instances
+
+    def _get_records(self):
+        ''' Query every region and flatten the responses into plain dicts
+        that can be stored in Ansible's cache '''
+
+        self._credential = self._get_credential()
+        http_profile = HttpProfile(keepAlive=True, reqTimeout=30)
+        self._client_profile = ClientProfile(
+            httpProfile=http_profile, signMethod="TC3-HMAC-SHA256")
+        states = set(self.get_option('instance_states'))
+        destination_variable = self.get_option('destination_variable')
+
+        regions = self._get_regions()
+        records = []
+        with ThreadPoolExecutor(max_workers=min(len(regions) or 1, 16)) as executor:
+            futures = [executor.submit(self._get_instances_by_region, region)
+                       for region in regions]
+            for future in futures:
+                region, instances = future.result()
+                for instance in instances:
+                    if instance.InstanceState not in states:
+                        continue
+                    if destination_variable == 'private_ip_address':
+                        addresses = instance.PrivateIpAddresses
+                    else:
+                        addresses = instance.PublicIpAddresses
+                    if not addresses:
+                        continue
+                    records.append({
+                        'dest': addresses[0],
+                        'region': region,
+                        'id': instance.InstanceId,
+                        'instance_name': instance.InstanceName,
+                        'instance_type': instance.InstanceType,
+                        'public_ip_address': instance.PublicIpAddresses,
+                        'private_ip_address': instance.PrivateIpAddresses,
+                        'availability_zone': instance.Placement.Zone,
+                        'status': instance.InstanceState,
+                    })
+        return records
+
+    def _populate(self, records):
+        ''' Feed the cached records into the shared inventory object '''
+
+        strict = self.get_option('strict')
+        self.inventory.add_group('tencentcloud')
+        for record in records:
+            dest = record['dest']
+            self.inventory.add_host(dest, group='tencentcloud')
+            for key, value in record.items():
+                if key != 'dest':
+                    self.inventory.set_variable(dest, key, value)
+            self.inventory.set_variable(dest, 'ansible_host', dest)
+
+            hostvars = self.inventory.get_host(dest).get_vars()
+            self._set_composite_vars(
+                self.get_option('compose'), hostvars, dest, strict=strict)
+            self._add_host_to_composed_groups(
+                self.get_option('groups'), hostvars, dest, strict=strict)
+            self._add_host_to_keyed_groups(
+                self.get_option('keyed_groups'), hostvars, dest, strict=strict)